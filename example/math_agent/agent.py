@@ -1,9 +1,207 @@
 from cerebrum.agents.base import BaseAgent
 from cerebrum.llm.communication import LLMQuery
-import json
+import orjson
 import traceback
 import logging
 import datetime
+import time
+import asyncio
+import functools
+import hashlib
+import types
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict, deque
+from collections.abc import Mapping
+from dataclasses import dataclass
+from enum import Enum
+from typing import ClassVar, Optional
+
+# Library code: console output is opt-in by attaching a handler to this logger
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class _ResponseCache:
+    """Thread-safe LRU of LLM answers keyed by a digest of the prompt parts"""
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(*parts):
+        digest = hashlib.blake2b()
+        for part in parts:
+            digest.update(part if isinstance(part, bytes) else str(part).encode())
+            digest.update(b"\x00")
+        return digest.hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+
+_RESPONSE_CACHE = _ResponseCache(maxsize=1024)
+
+
+def _is_cacheable_response(response):
+    """Only successful replies with real text are worth replaying to other agents"""
+    if getattr(response, "error", None) or getattr(response, "status_code", 200) != 200:
+        return False
+    message = response.response_message
+    return isinstance(message, str) and bool(message.strip())
+
+def _run_sync(coro):
+    """Run `coro` to completion from synchronous code.
+
+    asyncio.run refuses to start inside a running loop (Jupyter, async
+    servers), so in that case the coroutine gets its own loop on a worker
+    thread. Like the original sync API, this blocks the caller until done.
+    """
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        return executor.submit(asyncio.run, coro).result()
+
+
+# Log entries are stamped with time.monotonic_ns(); this offset turns them
+# back into wall-clock time when the logs are read.
+_MONOTONIC_TO_WALL_NS = time.time_ns() - time.monotonic_ns()
+
+
+def _format_timestamp(monotonic_ns):
+    return datetime.datetime.fromtimestamp((monotonic_ns + _MONOTONIC_TO_WALL_NS) / 1e9).isoformat()
+
+
+# Queries are assembled from values the agent already controls, so skip
+# pydantic validation (model_construct in v2, construct in v1). A fresh query
+# per step is kept on purpose: steps of a batch are in flight concurrently.
+_build_query = getattr(LLMQuery, "model_construct", None) or getattr(LLMQuery, "construct", LLMQuery)
+
+
+_PLAN_INSTRUCTION_TEMPLATE = (
+    "You are given the available tools from the tool list: {tool_info} to help you solve problems. "
+    "Generate a plan with comprehensive yet minimal steps to fulfill the task. "
+    "The plan must follow the json format as below: "
+    "["
+    '{{"action_type": "action_type_value", "action": "action_value","tool_use": [tool_name1, tool_name2,...]}}'
+    '{{"action_type": "action_type_value", "action": "action_value", "tool_use": [tool_name1, tool_name2,...]}}'
+    "..."
+    "]"
+    "In each step of the planned plan, identify tools to use and recognize no tool is necessary. "
+    'A tool_use step may add "independent": true when it does not need the result of the step before it, '
+    "so both can run at the same time; leave it out otherwise. "
+    "Followings are some plan examples. "
+    "[" "["
+    '{{"action_type": "tool_use", "action": "gather information from arxiv. ", "tool_use": ["arxiv"]}},'
+    '{{"action_type": "chat", "action": "write a summarization based on the gathered information. ", "tool_use": []}}'
+    "];"
+    "["
+    '{{"action_type": "tool_use", "action": "gather information from arxiv. ", "tool_use": ["arxiv"]}},'
+    '{{"action_type": "chat", "action": "understand the current methods and propose ideas that can improve ", "tool_use": []}}'
+    "];"
+    "["
+    '{{"action_type": "tool_use", "action": "gather information from arxiv. ", "tool_use": ["arxiv"]}},'
+    '{{"action_type": "tool_use", "action": "look up background on wikipedia. ", "tool_use": ["wikipedia"], "independent": true}},'
+    '{{"action_type": "chat", "action": "combine both sources into an answer. ", "tool_use": []}}'
+    "]"
+    "]"
+)
+
+_MANUAL_WORKFLOW = (
+    types.MappingProxyType(
+        {
+            "action_type": "tool_use",
+            "action": "Search for relevant mathematical concepts and formulas",
+            "tool_use": ("demo_author/arxiv",),
+        }
+    ),
+    types.MappingProxyType(
+        {
+            "action_type": "chat",
+            "action": "Analyze the mathematical problem and provide solution steps",
+            "tool_use": (),
+        }
+    ),
+    types.MappingProxyType(
+        {
+            "action_type": "chat",
+            "action": "Calculate and verify the final answer",
+            "tool_use": (),
+        }
+    ),
+)
+
+_WORKFLOW_STEP_KEYS = frozenset(("action_type", "action", "tool_use"))
+
+_WORKFLOW_PROMPT = "[Thinking]: The workflow generated for the problem is {workflow}. Follow the workflow to solve the problem step by step. "
+
+
+class Status(str, Enum):
+    INITIALIZED = "initialized"
+    RUNNING = "running"
+    BUILDING_SYSTEM_INSTRUCTION = "building_system_instruction"
+    SYSTEM_INSTRUCTION_BUILT = "system_instruction_built"
+    GENERATING_WORKFLOW = "generating_workflow"
+    WORKFLOW_GENERATED = "workflow_generated"
+    WORKFLOW_GENERATION_FAILED = "workflow_generation_failed"
+    EXECUTING_WORKFLOW = "executing_workflow"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    ERROR = "error"
+
+    def __str__(self):
+        return self.value
+
+
+# (old, new) -> log message, filled in on first use of each transition
+_STATUS_TRANSITION_MESSAGES = {}
+
+
+@dataclass(slots=True, eq=False)
+class AgentResult(Mapping):
+    """Outcome of MathAgent.run.
+
+    Reads like the dict it replaces: item access, `in`, iteration, dict(result)
+    and == against dicts (eq=False keeps Mapping.__eq__). "error" is only
+    present when set. It is not a dict subclass, so stdlib
+    json.dumps needs dict(result) or dataclasses.asdict; orjson serializes it as is.
+    """
+
+    _KEYS: ClassVar[tuple] = ("agent_name", "result", "rounds", "status", "debug_logs", "error")
+
+    agent_name: str
+    result: str
+    rounds: int
+    status: Status
+    debug_logs: list
+    error: Optional[str] = None
+
+    def __getitem__(self, key):
+        if key not in self._KEYS or (key == "error" and self.error is None):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __iter__(self):
+        return iter(self._KEYS if self.error is not None else self._KEYS[:-1])
+
+    def __len__(self):
+        return len(self._KEYS) if self.error is not None else len(self._KEYS) - 1
+
 
 class MathAgent(BaseAgent):
     def __init__(self, agent_name, task_input, config_):
@@ -12,6 +210,9 @@ class MathAgent(BaseAgent):
 
             self.plan_max_fail_times = 3
             self.tool_call_max_fail_times = 3
+            self.step_context_turns = 2  # previous step turns resent with each step
+            self.use_response_cache = True  # reuse answers to identical chat steps
+            self._selected_tools_cache = {}  # tuple(tool names) -> selected tools
 
             self.start_time = None
             self.end_time = None
@@ -21,48 +222,60 @@ class MathAgent(BaseAgent):
             self.messages = []
             self.workflow_mode = "manual"  # (manual, automatic)
             self.rounds = 0
-            self.status = "initialized"  # 添加状态跟踪
-            self.debug_logs = []  # 用于收集调试信息
+            self.status = Status.INITIALIZED  # 添加状态跟踪
+            self.debug_logs = deque(maxlen=1024)  # 用于收集调试信息, 只保留最近的记录
+            self.collect_debug_logs = True  # False skips building debug_logs entries
             self._log_debug(f"MathAgent initialized with name: {agent_name}, task: {task_input}")
             self._log_debug(f"Initial status: {self.status}")
         except Exception as e:
-            print(f"[ERROR] Failed to initialize MathAgent: {str(e)}")
-            print(traceback.format_exc())
+            logger.exception("Failed to initialize MathAgent: %s", e)
             raise
 
     def _log_debug(self, message: str):
         """记录调试信息到实例变量"""
-        log_entry = {
-            "type": "debug",
-            "message": message,
-            "timestamp": datetime.datetime.now().isoformat()
-        }
-        print(f"[DEBUG] {message}")  # 立即打印到控制台
-        self.debug_logs.append(log_entry)
+        logger.debug(message)
+        if self.collect_debug_logs:
+            self.debug_logs.append({
+                "type": "debug",
+                "message": message,
+                "timestamp": time.monotonic_ns()
+            })
 
     def _log_error(self, message: str, error: Exception = None):
         """记录错误信息到实例变量"""
+        # one record; handlers format the traceback only if they emit it
+        logger.error(message, exc_info=error)
+        if not self.collect_debug_logs:
+            return
         error_info = {
             "type": "error",
             "message": message,
-            "timestamp": datetime.datetime.now().isoformat()
+            "timestamp": time.monotonic_ns()
         }
         if error:
             error_info["error"] = str(error)
             error_info["traceback"] = traceback.format_exc()
-        print(f"[ERROR] {message}")  # 立即打印到控制台
-        if error:
-            print(f"[ERROR] Exception: {str(error)}")
-            print(f"[ERROR] Traceback:\n{traceback.format_exc()}")
         self.debug_logs.append(error_info)
 
-    def _update_status(self, new_status: str):
+    def _update_status(self, new_status: Status):
         """Helper method to update and log status changes"""
         old_status = self.status
         self.status = new_status
-        message = f"Status changed: {old_status} -> {new_status}"
+        if not self.collect_debug_logs and not logger.isEnabledFor(logging.DEBUG):
+            return
+        message = _STATUS_TRANSITION_MESSAGES.get((old_status, new_status))
+        if message is None:
+            message = f"Status changed: {old_status} -> {new_status}"
+            _STATUS_TRANSITION_MESSAGES[(old_status, new_status)] = message
         self._log_debug(message)
 
+    def _formatted_debug_logs(self):
+        """Copy of the debug logs with ISO timestamps"""
+        return [
+            {**entry, "timestamp": _format_timestamp(entry["timestamp"])}
+            for entry in self.debug_logs
+        ]
+
     def get_status(self):
         """返回当前agent的状态信息"""
         try:
@@ -71,38 +284,41 @@ class MathAgent(BaseAgent):
                 "status": self.status,
                 "rounds": self.rounds,
                 "workflow_mode": self.workflow_mode,
-                "debug_logs": self.debug_logs,  # 包含调试日志
+                "debug_logs": self._formatted_debug_logs(),  # 包含调试日志
                 "timestamp": datetime.datetime.now().isoformat()
             }
             self._log_debug("Status requested")
-            print(f"[DEBUG] Full status info: {json.dumps(status_info, indent=2)}")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Full status info: %s", orjson.dumps(status_info, option=orjson.OPT_INDENT_2).decode())
             return status_info
         except Exception as e:
             error_msg = f"Error getting status: {str(e)}"
             self._log_error(error_msg, e)
             error_info = {
                 "agent_name": self.agent_name,
-                "status": "error",
+                "status": Status.ERROR,
                 "error": str(e),
-                "debug_logs": self.debug_logs,
+                "debug_logs": self._formatted_debug_logs(),
                 "timestamp": datetime.datetime.now().isoformat()
             }
             return error_info
 
     def run(self):
+        return _run_sync(self.arun())
+
+    async def arun(self):
         try:
-            self._update_status("running")
+            self._update_status(Status.RUNNING)
             self._log_debug(f"Starting run with task: {self.task_input}")
             
             if not self.build_system_instruction():
-                error_result = {
-                    "agent_name": self.agent_name,
-                    "result": "Failed to build system instruction",
-                    "rounds": self.rounds,
-                    "status": self.status,
-                    "debug_logs": self.debug_logs
-                }
-                return error_result
+                return AgentResult(
+                    agent_name=self.agent_name,
+                    result="Failed to build system instruction",
+                    rounds=self.rounds,
+                    status=self.status,
+                    debug_logs=self._formatted_debug_logs(),
+                )
 
             task_input = self.task_input
             self.messages.append({"role": "user", "content": task_input})
@@ -110,184 +326,253 @@ class MathAgent(BaseAgent):
             workflow = None
 
             if self.workflow_mode == "automatic":
-                workflow = self.automatic_workflow()
-                self.messages = self.messages[:1]  # clear long context
+                workflow = await self.aautomatic_workflow()
+                del self.messages[1:-1]  # drop the planning prompt, keep system + task
             else:
                 workflow = self.manual_workflow()
 
             if not workflow:
-                self._update_status("failed")
-                error_result = {
-                    "agent_name": self.agent_name,
-                    "result": "Failed to generate a valid workflow.",
-                    "rounds": self.rounds,
-                    "status": self.status,
-                    "debug_logs": self.debug_logs
-                }
-                return error_result
+                self._update_status(Status.FAILED)
+                return AgentResult(
+                    agent_name=self.agent_name,
+                    result="Failed to generate a valid workflow.",
+                    rounds=self.rounds,
+                    status=self.status,
+                    debug_logs=self._formatted_debug_logs(),
+                )
 
             self.messages.append(
                 {
                     "role": "user",
-                    "content": f"[Thinking]: The workflow generated for the problem is {json.dumps(workflow)}. Follow the workflow to solve the problem step by step. ",
+                    "content": _WORKFLOW_PROMPT.format(workflow=orjson.dumps(workflow).decode()),
                 }
             )
 
             final_result = ""
-            self._update_status("executing_workflow")
-
-            for i, step in enumerate(workflow):
-                action_type = step["action_type"]
-                action = step["action"]
-                tool_use = step["tool_use"]
+            self._update_status(Status.EXECUTING_WORKFLOW)
 
-                self._log_debug(f"Executing step {i+1}: {action}")
-                prompt = f"At step {i + 1}, you need to: {action}. "
-                self.messages.append({"role": "user", "content": prompt})
-
-                if tool_use:
-                    selected_tools = self.pre_select_tools(tool_use)
-                else:
-                    selected_tools = None
-
-                response = self.send_request(
-                    agent_name=self.agent_name,
-                    query=LLMQuery(
-                        messages=self.messages,
-                        tools=selected_tools,
-                        action_type=action_type,
-                    ),
-                )["response"]
-                
-                self.messages.append({"role": "assistant", "content": response.response_message})
-                self.rounds += 1
+            # every step sees the fixed head (system, task, workflow) plus only the
+            # most recent turns, so prompts grow linearly instead of quadratically
+            head = list(self.messages)
+            recent = deque(maxlen=2 * self.step_context_turns)
+            for batch in self._group_independent_steps(workflow):
+                context = head + list(recent)
+                if len(batch) > 1:
+                    self._log_debug(f"Dispatching steps {[i + 1 for i, _ in batch]} concurrently")
+                # gather keeps the turns in workflow order regardless of finish order
+                turns = await asyncio.gather(
+                    *(self._execute_step(i, step, context) for i, step in batch)
+                )
+                for prompt, answer in turns:
+                    self.messages.append(prompt)
+                    self.messages.append(answer)
+                    recent.append(prompt)
+                    recent.append(answer)
+                    self.rounds += 1
 
             final_result = self.messages[-1]["content"]
-            self._update_status("completed")
+            self._update_status(Status.COMPLETED)
             
-            success_result = {
-                "agent_name": self.agent_name,
-                "result": final_result,
-                "rounds": self.rounds,
-                "status": self.status,
-                "debug_logs": self.debug_logs
-            }
-            return success_result
+            return AgentResult(
+                agent_name=self.agent_name,
+                result=final_result,
+                rounds=self.rounds,
+                status=self.status,
+                debug_logs=self._formatted_debug_logs(),
+            )
 
         except Exception as e:
-            self._update_status("error")
+            self._update_status(Status.ERROR)
             self._log_error("Error during execution", e)
             
-            error_result = {
-                "agent_name": self.agent_name,
-                "result": f"Error occurred during execution: {str(e)}",
-                "rounds": self.rounds,
-                "status": self.status,
-                "error": str(e),
-                "debug_logs": self.debug_logs
-            }
-            return error_result
+            return AgentResult(
+                agent_name=self.agent_name,
+                result=f"Error occurred during execution: {str(e)}",
+                rounds=self.rounds,
+                status=self.status,
+                debug_logs=self._formatted_debug_logs(),
+                error=str(e),
+            )
+
+    def _group_independent_steps(self, workflow):
+        """Group consecutive tool_use steps that can be dispatched together.
+
+        A step normally builds on the answer of the step before it, so steps run
+        one after another. A tool_use step only joins the batch of the tool_use
+        step before it when the plan marks it with "independent": true and it
+        uses none of the tools already in that batch.
+        """
+        batches = []
+        batch_tools = None  # tools of the current batch, None if it can't grow
+        for i, step in enumerate(workflow):
+            tools = set(step["tool_use"]) if step["action_type"] == "tool_use" else set()
+            if (
+                batch_tools is not None
+                and tools
+                and step.get("independent") is True
+                and batch_tools.isdisjoint(tools)
+            ):
+                batches[-1].append((i, step))
+                batch_tools |= tools
+            else:
+                batches.append([(i, step)])
+                batch_tools = tools or None
+        return batches
+
+    def pre_select_tools(self, tool_use):
+        # tool selection only depends on the names, memoize it per agent
+        key = tuple(tool_use)
+        selected_tools = self._selected_tools_cache.get(key)
+        if selected_tools is None:
+            selected_tools = super().pre_select_tools(list(key))
+            self._selected_tools_cache[key] = selected_tools
+        return selected_tools
+
+    async def asend_request(self, agent_name, query):
+        """Awaitable send_request; the blocking round-trip runs in a worker thread"""
+        return await asyncio.to_thread(self.send_request, agent_name=agent_name, query=query)
+
+    async def _execute_step(self, i, step, context):
+        """Send a single workflow step on top of `context` and return the turn"""
+        action_type = step["action_type"]
+        action = step["action"]
+        tool_use = step["tool_use"]
+
+        self._log_debug(f"Executing step {i+1}: {action}")
+        prompt = {"role": "user", "content": f"At step {i + 1}, you need to: {action}. "}
+
+        if tool_use:
+            selected_tools = self.pre_select_tools(tool_use)
+        else:
+            selected_tools = None
+
+        query = _build_query(
+            messages=context + [prompt],
+            tools=selected_tools,
+            action_type=action_type,
+        )
+        # tool steps return live results (e.g. searches), so only chat steps are cached
+        cacheable = self.use_response_cache and not selected_tools
+        if cacheable:
+            cache_key = _ResponseCache.key(
+                action_type,
+                orjson.dumps(query.messages),
+                orjson.dumps(selected_tools),
+                orjson.dumps(getattr(query, "llms", None), default=str),  # answers are per model
+            )
+            response_message = _RESPONSE_CACHE.get(cache_key)
+            if response_message is not None:
+                self._log_debug(f"Step {i+1} answered from response cache")
+                return prompt, {"role": "assistant", "content": response_message}
+
+        response = (await self.asend_request(agent_name=self.agent_name, query=query))["response"]
+        response_message = response.response_message
+        if cacheable and _is_cacheable_response(response):
+            _RESPONSE_CACHE.put(cache_key, response_message)
+
+        return prompt, {"role": "assistant", "content": response_message}
+
+    @functools.cached_property
+    def _tool_info_json(self):
+        return orjson.dumps(self.tool_info).decode()
+
+    @functools.cached_property
+    def _system_prefix(self):
+        description = self.config["description"]
+        return description if isinstance(description, str) else "".join(description)
 
     def build_system_instruction(self):
         try:
-            self._update_status("building_system_instruction")
-            prefix = "".join(["".join(self.config["description"])])
-
-            plan_instruction = "".join(
-                [
-                    f"You are given the available tools from the tool list: {json.dumps(self.tool_info)} to help you solve problems. ",
-                    "Generate a plan with comprehensive yet minimal steps to fulfill the task. ",
-                    "The plan must follow the json format as below: ",
-                    "[",
-                    '{"action_type": "action_type_value", "action": "action_value","tool_use": [tool_name1, tool_name2,...]}',
-                    '{"action_type": "action_type_value", "action": "action_value", "tool_use": [tool_name1, tool_name2,...]}',
-                    "...",
-                    "]",
-                    "In each step of the planned plan, identify tools to use and recognize no tool is necessary. ",
-                    "Followings are some plan examples. ",
-                    "[" "[",
-                    '{"action_type": "tool_use", "action": "gather information from arxiv. ", "tool_use": ["arxiv"]},',
-                    '{"action_type": "chat", "action": "write a summarization based on the gathered information. ", "tool_use": []}',
-                    "];",
-                    "[",
-                    '{"action_type": "tool_use", "action": "gather information from arxiv. ", "tool_use": ["arxiv"]},',
-                    '{"action_type": "chat", "action": "understand the current methods and propose ideas that can improve ", "tool_use": []}',
-                    "]",
-                    "]",
-                ]
-            )
+            self._update_status(Status.BUILDING_SYSTEM_INSTRUCTION)
+            assert self.workflow_mode in ("manual", "automatic")
 
-            if self.workflow_mode == "manual":
-                self.messages.append({"role": "system", "content": prefix})
-            else:
-                assert self.workflow_mode == "automatic"
-                self.messages.append({"role": "system", "content": prefix})
+            # Only static text goes here; run appends the task input afterwards, so
+            # backends that cache prompt prefixes automatically (e.g. OpenAI) can
+            # reuse it. An explicit Anthropic cache_control marker has to sit on a
+            # content block, which LLMQuery does not pass through yet.
+            self.messages.append({"role": "system", "content": self._system_prefix})
+            if self.workflow_mode == "automatic":
+                plan_instruction = _PLAN_INSTRUCTION_TEMPLATE.format(tool_info=self._tool_info_json)
                 self.messages.append({"role": "user", "content": plan_instruction})
-            
-            self._update_status("system_instruction_built")
+
+            self._update_status(Status.SYSTEM_INSTRUCTION_BUILT)
             return True
         except Exception as e:
             self._log_error("Error in build_system_instruction", e)
-            self._update_status("error")
+            self._update_status(Status.ERROR)
             return False
 
-    def manual_workflow(self):
-        try:
-            self._update_status("generating_workflow")
-            workflow = [
-                {
-                    "action_type": "tool_use",
-                    "action": "Search for relevant mathematical concepts and formulas",
-                    "tool_use": ["demo_author/arxiv"],
-                },
-                {
-                    "action_type": "chat",
-                    "action": "Analyze the mathematical problem and provide solution steps",
-                    "tool_use": [],
-                },
-                {
-                    "action_type": "chat",
-                    "action": "Calculate and verify the final answer",
-                    "tool_use": [],
-                }
-            ]
-            self._update_status("workflow_generated")
-            return workflow
-        except Exception as e:
-            self._log_error("Error in manual_workflow", e)
-            self._update_status("error")
+    def check_workflow(self, message):
+        """Parse a generated plan, returning None unless every step is well formed"""
+        if isinstance(message, (str, bytes)):
+            try:
+                workflow = orjson.loads(message)
+            except orjson.JSONDecodeError:
+                return None
+        else:
+            workflow = message
+
+        if not isinstance(workflow, list):
             return None
+        for step in workflow:
+            if not isinstance(step, dict) or not _WORKFLOW_STEP_KEYS <= step.keys():
+                return None
+            if not isinstance(step["tool_use"], list):
+                return None
+            if not isinstance(step.get("independent", False), bool):
+                return None
+        return workflow
+
+    def manual_workflow(self):
+        self._update_status(Status.GENERATING_WORKFLOW)
+        # steps are read-only mappings, callers get their own JSON-serializable dicts
+        workflow = [dict(step) for step in _MANUAL_WORKFLOW]
+        self._update_status(Status.WORKFLOW_GENERATED)
+        return workflow
 
     def automatic_workflow(self):
+        return _run_sync(self.aautomatic_workflow())
+
+    async def aautomatic_workflow(self):
         try:
-            self._update_status("generating_workflow")
-            for i in range(self.plan_max_fail_times):
-                response = self.send_request(
-                    agent_name=self.agent_name,
-                    query=LLMQuery(
-                        messages=self.messages, tools=None, message_return_type="json"
-                    ),
-                )["response"]
-
-                workflow = self.check_workflow(response.response_message)
-
-                self.rounds += 1
-
-                if workflow:
-                    self._update_status("workflow_generated")
-                    return workflow
-                else:
-                    self.messages.append(
-                        {
-                            "role": "assistant",
-                            "content": f"Fail {i+1} times to generate a valid plan. I need to regenerate a plan",
-                        }
-                    )
-            self._update_status("workflow_generation_failed")
+            self._update_status(Status.GENERATING_WORKFLOW)
+            # all candidates are requested at once; the first valid plan wins
+            query = _build_query(
+                messages=list(self.messages), tools=None, message_return_type="json"
+            )
+            pending = {
+                asyncio.ensure_future(self.asend_request(agent_name=self.agent_name, query=query))
+                for _ in range(self.plan_max_fail_times)
+            }
+            attempts = 0
+            try:
+                while pending:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for candidate in done:
+                        attempts += 1
+                        try:
+                            response = candidate.result()["response"]
+                        except Exception as e:
+                            # one failed request must not sink the other candidates
+                            self._log_error(f"Plan candidate {attempts} failed", e)
+                            continue
+                        workflow = self.check_workflow(response.response_message)
+                        if workflow:
+                            self._update_status(Status.WORKFLOW_GENERATED)
+                            return workflow
+                        self._log_debug(f"Fail {attempts} times to generate a valid plan")
+            finally:
+                # Only drops the awaiting side: a request already running in its
+                # to_thread worker still completes (and is billed), its answer unused.
+                for candidate in pending:
+                    candidate.cancel()
+                self.rounds += attempts
+
+            self._update_status(Status.WORKFLOW_GENERATION_FAILED)
             return None
         except Exception as e:
             self._log_error("Error in automatic_workflow", e)
-            self._update_status("error")
+            self._update_status(Status.ERROR)
             return None
 
     def __str__(self):